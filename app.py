@@ -1,23 +1,43 @@
-from io import StringIO
+import hashlib
 from pathlib import Path
 
 import dash
 from dash import Dash, dcc, html, Input, Output, State, dash_table
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 import pandas as pd
+from flask_caching import Cache
 
 import functions as fx
 
 # -------- Data load / initial state --------
-RAW = fx.load_data()
+# Memoized on disk (keyed by master file mtime+size) so workers boot fast
+RAW = fx.load_data_cached()
+DATA_VERSION = fx.data_version()  # part of every view-cache key
+# Rendering code fingerprint (this file + functions.py), also in every key, so
+# a restart after a layout/template/column change never serves old figures
+CODE_VERSION = hashlib.blake2b(
+    Path(__file__).read_bytes() + fx.CODE_VERSION.encode(), digest_size=8
+).hexdigest()
 # If you later enrich with a registry CSV, RAW may include county/sub_county
 FILTER_META = fx.available_filters(RAW)  # vendors, months, years
-INITIAL_JSON = RAW.to_json(date_format="iso", orient="split")
+# Group-level rollups; callbacks slice these instead of the raw rows
+AGGS = fx.build_aggregates(RAW)
 
 app = Dash(__name__, title="SHA Disbursements")
 server = app.server  # for WSGI deploys
 
+# Rendered views shared across users/tabs/workers, keyed by filter selection
+cache = Cache(
+    server,
+    config={
+        "CACHE_TYPE": "FileSystemCache",
+        "CACHE_DIR": str(fx.CACHE_DIR / "dash"),
+        "CACHE_DEFAULT_TIMEOUT": 3600,
+    },
+)
+
 
 def stat_card(title, value, id_val=None):
     return html.Div(
@@ -33,29 +53,57 @@ def stat_card(title, value, id_val=None):
     )
 
 
-# No dash-table Format usage (keeps compatibility across versions)
-amount_col = {"name": "amount", "id": "amount", "type": "numeric"}
+# -------- Figure styling --------
+# Registered once; px figures pick it up via the default template
+pio.templates["sha"] = go.layout.Template(
+    layout=dict(
+        autosize=True,
+        height=420,
+        margin=dict(l=10, r=10, t=10, b=10),
+        paper_bgcolor="var(--panel-bg)",
+        plot_bgcolor="var(--panel-bg)",
+        font=dict(color="var(--text)"),
+    )
+)
+pio.templates.default = "plotly+sha"
 
+# Placeholder figure for empty selections, serialized once
+EMPTY_FIG = px.bar(pd.DataFrame({"x": [], "y": []}), x="x", y="y").to_dict()
+
+
+def sunburst_figure(aggs):
+    """Sunburst (county → sub_county) else (year → month), as a figure dict."""
+    if not aggs["by_county_sub"].empty:
+        return px.sunburst(
+            aggs["by_county_sub"], path=["county", "sub_county"], values="amount"
+        ).to_dict()
+    if not aggs["by_ym"].empty:
+        return px.sunburst(
+            aggs["by_ym"], path=["report_year", "report_month"], values="amount"
+        ).to_dict()
+    return EMPTY_FIG
 
-def make_month_key(df: pd.DataFrame) -> pd.DataFrame:
-    """
-    Add chronological month key columns if report_year & report_month exist.
-    - 'ym' (Period[M]) for sorting
-    - 'year_month' display label like 'Apr-2025'
-    """
-    if {"report_year", "report_month"}.issubset(df.columns):
-        dt = pd.to_datetime(
-            df["report_year"].astype(str) + "-" + df["report_month"].astype(str),
-            format="%Y-%B",
-            errors="coerce",
-        )
-        df = df.assign(
-            ym=dt.dt.to_period("M"),
-            year_month=dt.dt.strftime("%b-%Y"),
-        )
-    else:
-        df = df.assign(ym=pd.NaT, year_month=pd.NA)
-    return df
+
+# Unfiltered hierarchy (the initial view) is built once per process
+SUNBURST_FULL = sunburst_figure(AGGS)
+
+
+# No dash-table Format usage (keeps compatibility across versions)
+amount_col = {"name": "amount", "id": "amount", "type": "numeric"}
+TABLE_COLUMNS = [
+    {"name": "vendor_name", "id": "vendor_name"},
+    amount_col,
+    {"name": "report_month", "id": "report_month"},
+    {"name": "report_year", "id": "report_year"},
+    {"name": "schedule", "id": "schedule"},
+    *([{"name": "county", "id": "county"}] if "county" in RAW.columns else []),
+    *(
+        [{"name": "sub_county", "id": "sub_county"}]
+        if "sub_county" in RAW.columns
+        else []
+    ),
+]
+TABLE_IDS = [c["id"] for c in TABLE_COLUMNS if c["id"] in RAW.columns]
 
 
 app.layout = html.Div(
@@ -219,23 +267,7 @@ app.layout = html.Div(
                         html.Div("Filtered Rows (first 500)", className="panel-title"),
                         dash_table.DataTable(
                             id="table",
-                            columns=[
-                                {"name": "vendor_name", "id": "vendor_name"},
-                                amount_col,
-                                {"name": "report_month", "id": "report_month"},
-                                {"name": "report_year", "id": "report_year"},
-                                {"name": "schedule", "id": "schedule"},
-                                *(
-                                    [{"name": "county", "id": "county"}]
-                                    if "county" in RAW.columns
-                                    else []
-                                ),
-                                *(
-                                    [{"name": "sub_county", "id": "sub_county"}]
-                                    if "sub_county" in RAW.columns
-                                    else []
-                                ),
-                            ],
+                            columns=TABLE_COLUMNS,
                             data=[],
                             page_size=10,
                             sort_action="native",
@@ -256,7 +288,7 @@ app.layout = html.Div(
                 ),
             ],
         ),
-        dcc.Store(id="filtered-json", data=INITIAL_JSON),  # seeded once
+        dcc.Store(id="filter-state", data={}),  # selected filters only
         html.Div(
             className="footer",
             children="Built for quick monitoring of SHA disbursements.",
@@ -267,7 +299,7 @@ app.layout = html.Div(
 
 # Apply filters only when button is clicked (no initial fire)
 @app.callback(
-    Output("filtered-json", "data"),
+    Output("filter-state", "data"),
     Input("apply-btn", "n_clicks"),
     State("vendor-dd", "value"),
     # State("county-dd", "value"),
@@ -277,48 +309,28 @@ app.layout = html.Div(
     prevent_initial_call=True,
 )
 def apply_filters(n_clicks, vendors, months, years):
-    df = fx.filter_data(RAW, vendors, months, years)  # existing filters
-    df = df.where(pd.notna(df), None)  # JSON-stable
-    return df.to_json(date_format="iso", orient="split")
+    # Only the selections cross the wire; RAW and AGGS stay server-side
+    return {"vendors": vendors or [], "months": months or [], "years": years or []}
 
 
-@app.callback(
-    Output("no-data-banner", "children"),
-    Output("top-vendors-chart", "figure"),
-    Output("by-month-chart", "figure"),
-    Output("sunburst-chart", "figure"),
-    Output("total-amount", "children"),
-    Output("total-facilities", "children"),
-    Output("total-rows", "children"),
-    Output("table", "data"),
-    Input("filtered-json", "data"),
-)
-def update_views(json_df):
-    if not json_df:
-        df = RAW.copy()
-    else:
-        df = pd.read_json(StringIO(json_df), orient="split")
-
-    # Banner + empty figures helper
-    def empty_fig():
-        f = px.bar(pd.DataFrame({"x": [], "y": []}), x="x", y="y")
-        f.update_layout(
-            autosize=True,
-            height=420,
-            margin=dict(l=10, r=10, t=10, b=10),
-            paper_bgcolor="var(--panel-bg)",
-            plot_bgcolor="var(--panel-bg)",
-            font_color="var(--text)",
-        )
-        return f
+@cache.memoize()
+def _compute_views(data_version, code_version, vendors, months, years):
+    """
+    Everything update_views renders, for one filter selection.
+    Memoized on (data_version, code_version, vendors, months, years); the
+    cache outlives restarts, so both versions are in the key. Figures are
+    returned as plain dicts so they pickle into the cache. Shared styling comes from
+    the "sha" template rather than per-figure update_layout calls.
+    """
+    aggs = fx.slice_aggregates(AGGS, vendors, months, years)
 
-    if df.empty:
+    if aggs["cells"].empty:
         banner = "No data available at the moment"
         return (
             banner,
-            empty_fig(),  # top vendors
-            empty_fig(),  # by month
-            empty_fig(),  # sunburst
+            EMPTY_FIG,  # top vendors
+            EMPTY_FIG,  # by month
+            EMPTY_FIG,  # sunburst
             "0.00",  # total amount
             "0",  # total facilities
             "0",  # rows
@@ -326,88 +338,45 @@ def update_views(json_df):
         )
 
     # Totals
-    t = fx.totals(df)
+    t = fx.aggregate_totals(aggs["cells"])
     tot_amount = f"{t['total_amount']:,.2f}"
     tot_f = f"{t['total_facilities']:,}"
     rows = f"{t['rows']:,}"
 
     # 1) Top vendors bar
-    tv = fx.top_vendors(df, k=20)
+    tv = aggs["by_vendor"].nlargest(20).reset_index()
     if tv.empty:
-        fig_bar = empty_fig()
+        fig_bar = EMPTY_FIG
     else:
         fig_bar = px.bar(tv, x="amount", y="vendor_name", orientation="h")
-        fig_bar.update_layout(
-            autosize=True,
-            height=420,
-            margin=dict(l=10, r=10, t=10, b=10),
-            paper_bgcolor="var(--panel-bg)",
-            plot_bgcolor="var(--panel-bg)",
-            font_color="var(--text)",
-            xaxis_title="KES",
-            yaxis_title="",
-        )
+        fig_bar.update_layout(xaxis_title="KES", yaxis_title="")
+        fig_bar = fig_bar.to_dict()
 
     # 2) Disbursement by month — labels 'Apr-2025' with chronological ordering
-    dfm = make_month_key(df)
-    if "ym" in dfm.columns and dfm["ym"].notna().any():
-        bym = (
-            dfm.dropna(subset=["ym"])
-            .groupby("ym", as_index=False)["amount"]
-            .sum()
-            .sort_values("ym")
-        )
+    # ('ym' is parsed once at load time; by_ym has one row per month)
+    if not aggs["by_ym"].empty:
+        bym = aggs["by_ym"].sort_values("ym")
         bym["year_month"] = bym["ym"].dt.strftime("%b-%Y")
         fig_month = px.bar(bym, x="year_month", y="amount")
         fig_month.update_xaxes(
             categoryorder="array", categoryarray=bym["year_month"].tolist()
         )
-        fig_month.update_layout(
-            autosize=True,
-            height=420,
-            margin=dict(l=10, r=10, t=10, b=10),
-            paper_bgcolor="var(--panel-bg)",
-            plot_bgcolor="var(--panel-bg)",
-            font_color="var(--text)",
-            xaxis_title="Month-Year",
-            yaxis_title="Amount in KES",
-        )
+        fig_month.update_layout(xaxis_title="Month-Year", yaxis_title="Amount in KES")
+        fig_month = fig_month.to_dict()
     else:
-        fig_month = empty_fig()
-
-    # 4) Sunburst (county → sub_county) else (year → month)
-    if {"county", "sub_county"}.issubset(df.columns) and df[
-        ["county", "sub_county"]
-    ].notna().any().any():
-        sun = df.groupby(["county", "sub_county"], as_index=False)["amount"].sum()
-        if sun.empty:
-            fig_sun = empty_fig()
-        else:
-            fig_sun = px.sunburst(sun, path=["county", "sub_county"], values="amount")
-    elif {"report_year", "report_month"}.issubset(df.columns):
-        sun = dfm.groupby(["report_year", "report_month"], as_index=False)[
-            "amount"
-        ].sum()
-        if sun.empty:
-            fig_sun = empty_fig()
-        else:
-            fig_sun = px.sunburst(
-                sun, path=["report_year", "report_month"], values="amount"
-            )
-    else:
-        fig_sun = empty_fig()
-
-    for fig in (fig_sun,):
-        fig.update_layout(
-            autosize=True,
-            height=420,
-            margin=dict(l=10, r=10, t=10, b=10),
-            paper_bgcolor="var(--panel-bg)",
-            plot_bgcolor="var(--panel-bg)",
-            font_color="var(--text)",
-        )
+        fig_month = EMPTY_FIG
+
+    # 4) Sunburst; the unfiltered view reuses the figure built at startup
+    fig_sun = SUNBURST_FULL if aggs is AGGS else sunburst_figure(aggs)
 
-    preview = df.head(500).to_dict("records")
+    # The table preview is the only view that needs raw rows
+    df = fx.filter_data(RAW, vendors, months, years)
+    # Only the displayed columns, zipped straight from row tuples
+    # (categoricals come out as plain strings)
+    head = df.head(500)[TABLE_IDS]
+    preview = [
+        dict(zip(TABLE_IDS, row)) for row in head.itertuples(index=False, name=None)
+    ]
     return (
         "",  # no banner
         fig_bar,
@@ -420,5 +389,25 @@ def update_views(json_df):
     )
 
 
+@app.callback(
+    Output("no-data-banner", "children"),
+    Output("top-vendors-chart", "figure"),
+    Output("by-month-chart", "figure"),
+    Output("sunburst-chart", "figure"),
+    Output("total-amount", "children"),
+    Output("total-facilities", "children"),
+    Output("total-rows", "children"),
+    Output("table", "data"),
+    Input("filter-state", "data"),
+)
+def update_views(state):
+    state = state or {}
+    # Canonical (sorted tuple) selections so equal filters share a cache entry
+    vendors, months, years = (
+        tuple(sorted(state.get(k) or [])) for k in ("vendors", "months", "years")
+    )
+    return _compute_views(DATA_VERSION, CODE_VERSION, vendors, months, years)
+
+
 if __name__ == "__main__":
     app.run(debug=False, use_reloader=False, host="0.0.0.0", port=8050)
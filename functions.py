@@ -1,14 +1,22 @@
 #!/usr/bin/env python3
+import hashlib
+import os
 import re
-import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, List, Dict
 
+import numpy as np
 import pandas as pd
 
 # ---------- Paths ----------
 MASTER_CSV = Path("extracted_data/sha_disbursements_master.csv")
+MASTER_PARQUET = MASTER_CSV.with_suffix(".parquet")
+CACHE_DIR = Path(".cache")
 REGISTRY_CSV = Path("extracted_data/kmhfr_facilities.csv")
+# Fingerprint of this module's source, part of the cached-frame key: a frame
+# cleaned by older code (e.g. before a column was added) is never served
+CODE_VERSION = hashlib.blake2b(Path(__file__).read_bytes(), digest_size=8).hexdigest()
 
 # ---------- Month ordering ----------
 MONTH_ORDER = [
@@ -29,6 +37,7 @@ MONTH_CAT = pd.CategoricalDtype(categories=MONTH_ORDER, ordered=True)
 
 # ---------- Junk row patterns ----------
 PAGE_ROW_RE = re.compile(r"^\s*page\s*\d+", re.I)
+AMOUNT_JUNK_RE = re.compile(r"[^\d.-]")
 
 # ---------- Optional fuzzy matcher ----------
 try:
@@ -38,30 +47,101 @@ try:
 except Exception:
     HAVE_RAPIDFUZZ = False
 
+# ---------- Optional Parquet support ----------
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    HAVE_PYARROW = True
+except Exception:
+    HAVE_PYARROW = False
+
+# Low-cardinality text columns stored dictionary-encoded in the Parquet cache
+DICT_COLS = ["vendor_name", "report_month", "county", "sub_county"]
+
 
 # ---------- Name cleaning ----------
+_RE_NONALNUM = re.compile(r"[^a-z0-9]+")
+_RE_STOPWORDS = re.compile(
+    r"\b(hospital|dispensary|clinic|medical|centre|center|health|facility)\b"
+)
+_RE_WS = re.compile(r"\s+")
+
+
+def _clean_name_series(s: pd.Series) -> pd.Series:
+    """Vectorized name key: ASCII-fold, lowercase, drop punctuation + stopwords."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # clean each distinct name once, then broadcast through the codes
+        cats = _clean_name_series(pd.Series(s.cat.categories, dtype=object))
+        lookup = np.append(cats.to_numpy(dtype=object), "")  # code -1 -> ""
+        return pd.Series(lookup[s.cat.codes.to_numpy()], index=s.index)
+    return (
+        s.fillna("")
+        .astype(str)
+        .str.normalize("NFKD")
+        .str.encode("ascii", "ignore")
+        .str.decode("ascii")
+        .str.lower()
+        .str.replace(_RE_NONALNUM, " ", regex=True)
+        .str.replace(_RE_STOPWORDS, " ", regex=True)
+        .str.replace(_RE_WS, " ", regex=True)
+        .str.strip()
+    )
+
+
 def _clean_name(s: str) -> str:
     if s is None:
         return ""
-    s = unicodedata.normalize("NFKD", str(s)).encode("ascii", "ignore").decode("ascii")
-    s = s.lower()
-    s = re.sub(r"[^a-z0-9]+", " ", s)
-    s = re.sub(
-        r"\b(hospital|dispensary|clinic|medical|centre|center|health|facility)\b",
-        " ",
-        s,
+    return _clean_name_series(pd.Series([s], dtype=object)).iat[0]
+
+
+# ---------- Parquet cache ----------
+def to_parquet_cache(path: Path | str = MASTER_CSV) -> Path:
+    """Write a typed Parquet sibling of the master CSV and return its path."""
+    p = Path(path)
+    out = p.with_suffix(".parquet")
+    df = pd.read_csv(p)
+    df.to_parquet(
+        out,
+        engine="pyarrow",
+        index=False,
+        use_dictionary=[c for c in DICT_COLS if c in df.columns],
     )
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    return out
 
 
-# ---------- Core load + cleaning pipeline ----------
-def load_data(path: Path | str = MASTER_CSV) -> pd.DataFrame:
-    """Read master CSV and apply all cleaning steps."""
+def _fresh_parquet(p: Path) -> Optional[Path]:
+    """Parquet sibling of `p` if present and newer than the CSV, else None."""
+    pq = p.with_suffix(".parquet")
+    if pq.exists() and pq.stat().st_mtime >= p.stat().st_mtime:
+        return pq
+    return None
+
+
+def read_master(path: Path | str = MASTER_CSV) -> pd.DataFrame:
+    """Read the raw master table, preferring the Parquet cache over the CSV."""
     p = Path(path)
+    if p.suffix == ".parquet":
+        return pd.read_parquet(p, engine="pyarrow", dtype_backend="pyarrow")
     if not p.exists():
         raise FileNotFoundError(f"Master CSV not found: {p}")
-    df = pd.read_csv(p)
+    if not HAVE_PYARROW:
+        return pd.read_csv(p)
+
+    pq = _fresh_parquet(p)
+    if pq is None:
+        try:
+            pq = to_parquet_cache(p)
+        except OSError:
+            # read-only deploy: fall back to the CSV
+            return pd.read_csv(p)
+    return pd.read_parquet(pq, engine="pyarrow", dtype_backend="pyarrow")
+
+
+# ---------- Core load + cleaning pipeline ----------
+def load_data(path: Path | str = MASTER_CSV) -> pd.DataFrame:
+    """Read master data (Parquet if available, else CSV) and apply all cleaning steps."""
+    df = read_master(path)
 
     # 1) standardize column names/types
     df = standardize(df)
@@ -75,6 +155,42 @@ def load_data(path: Path | str = MASTER_CSV) -> pd.DataFrame:
     return df.reset_index(drop=True)
 
 
+def data_version(path: Path | str = MASTER_CSV) -> str:
+    """mtime + size fingerprint of the master file, for cache keys."""
+    st = Path(path).stat()
+    return f"{st.st_mtime_ns}_{st.st_size}"
+
+
+def load_data_cached(
+    path: Path | str = MASTER_CSV, cache_dir: Path | str = CACHE_DIR
+) -> pd.DataFrame:
+    """
+    `load_data`, memoized on disk as Feather.
+    Cache files are keyed by CODE_VERSION and the source file's mtime + size,
+    so editing either the cleaning code or the master data invalidates them;
+    older entries are pruned on rewrite.
+    """
+    p = Path(path)
+    if not p.exists():
+        raise FileNotFoundError(f"Master CSV not found: {p}")
+    cdir = Path(cache_dir)
+    frame_path = cdir / f"sha_master_{CODE_VERSION}_{data_version(p)}.feather"
+
+    if HAVE_PYARROW and frame_path.exists():
+        return pd.read_feather(frame_path)
+
+    df = load_data(p)
+    if HAVE_PYARROW:
+        try:
+            cdir.mkdir(parents=True, exist_ok=True)
+            for old in cdir.glob("sha_master_*"):
+                old.unlink()
+            df.to_feather(frame_path)
+        except OSError:
+            pass  # caching is best-effort
+    return df
+
+
 def standardize(df: pd.DataFrame) -> pd.DataFrame:
     """Normalize columns, dtypes, and basic cleanliness."""
     if df.empty:
@@ -116,15 +232,9 @@ def standardize(df: pd.DataFrame) -> pd.DataFrame:
             .str.strip()
         )
 
-    # amount numeric
-    if "amount" in out.columns:
-        out["amount"] = (
-            out["amount"]
-            .astype(str)
-            .str.replace(r"[^\d.,-]", "", regex=True)
-            .str.replace(",", "", regex=False)
-        )
-        out["amount"] = pd.to_numeric(out["amount"], errors="coerce")
+    # amount numeric (Parquet-sourced amounts are already typed)
+    if "amount" in out.columns and not pd.api.types.is_numeric_dtype(out["amount"]):
+        out["amount"] = clean_amount(out["amount"])
 
     # month/year/schedule dtypes
     if "report_year" in out.columns:
@@ -142,6 +252,9 @@ def standardize(df: pd.DataFrame) -> pd.DataFrame:
             "Int64"
         )
 
+    # chronological month key, parsed once here rather than per callback
+    out = add_month_key(out)
+
     # county/subcounty tidy
     for col in ("county", "sub_county"):
         if col in out.columns:
@@ -157,14 +270,65 @@ def standardize(df: pd.DataFrame) -> pd.DataFrame:
     if "vendor_name" in out.columns:
         out = out[out["vendor_name"].notna() & (out["vendor_name"].str.len() > 0)]
 
+    # repeating names -> category (int codes + one copy of each string)
+    for col in ("vendor_name", "county", "sub_county"):
+        if col in out.columns:
+            out[col] = out[col].astype("category")
+
     return out.reset_index(drop=True)
 
 
+def add_month_key(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add chronological month key columns if report_year & report_month exist.
+    - 'ym' (Period[M]) for sorting
+    - 'year_month' display label like 'Apr-2025'
+    """
+    if {"report_year", "report_month"}.issubset(df.columns):
+        dt = pd.to_datetime(
+            df["report_year"].astype(str) + "-" + df["report_month"].astype(str),
+            format="%Y-%B",
+            errors="coerce",
+        )
+        df = df.assign(
+            ym=dt.dt.to_period("M"),
+            year_month=dt.dt.strftime("%b-%Y"),
+        )
+    else:
+        df = df.assign(ym=pd.NaT, year_month=pd.NA)
+    return df
+
+
+def clean_amount(col: pd.Series) -> pd.Series:
+    """
+    Text amounts like 'KES 1,234.50' -> float64 (NaN when unparseable).
+    Stripping every non-numeric char (commas included) is a single regex pass;
+    with pyarrow the validate + cast also run as compute kernels.
+    """
+    if not HAVE_PYARROW:
+        digits = col.astype(str).str.replace(AMOUNT_JUNK_RE, "", regex=True)
+        return pd.to_numeric(digits, errors="coerce")
+
+    arr = pa.array(
+        col.astype(str).to_numpy(dtype=object), type=pa.string(), from_pandas=True
+    )
+    digits = pc.replace_substring_regex(arr, pattern=r"[^0-9.\-]", replacement="")
+    valid = pc.match_substring_regex(digits, pattern=r"^-?(\d+\.?\d*|\.\d+)$")
+    nums = pc.cast(
+        pc.if_else(valid, digits, pa.scalar(None, pa.string())), pa.float64()
+    )
+    return pd.Series(
+        nums.to_numpy(zero_copy_only=False), index=col.index, name=col.name
+    )
+
+
 def remove_page_rows(df: pd.DataFrame) -> pd.DataFrame:
     """Drop PDF header junk like 'Page 3' leaking into vendor column."""
     if "vendor_name" not in df.columns or df.empty:
         return df
-    keep = ~df["vendor_name"].astype(str).str.match(PAGE_ROW_RE)
+    # vendor_name is already text/category after standardize; category .str
+    # methods run once per distinct name, then broadcast through the codes
+    keep = ~df["vendor_name"].str.match(PAGE_ROW_RE, na=False)
     return df.loc[keep].reset_index(drop=True)
 
 
@@ -194,20 +358,61 @@ def load_registry(path: Path | str = REGISTRY_CSV) -> pd.DataFrame:
         )
     reg = pd.read_csv(p)
     if "facility_name_clean" not in reg.columns:
-        reg["facility_name_clean"] = (
-            reg["official_name"].fillna(reg["name"]).map(_clean_name)
+        reg["facility_name_clean"] = _clean_name_series(
+            reg["official_name"].fillna(reg["name"])
         )
     return reg
 
 
+# Below this many queries a single cdist call beats splitting the batch
+PARALLEL_MIN_QUERIES = 1024
+
+
+def _score_block(
+    queries: np.ndarray, choices: np.ndarray, score_cutoff: int, workers: int
+):
+    # Query x choice score matrix in one C call; sub-cutoff scores are 0
+    scores = process.cdist(
+        queries,
+        choices,
+        scorer=fuzz.token_sort_ratio,
+        score_cutoff=score_cutoff,
+        dtype=np.uint8,
+        workers=workers,
+    )
+    best = scores.argmax(axis=1)
+    return best, scores[np.arange(len(queries)), best]
+
+
+def _best_matches(queries: np.ndarray, choices: np.ndarray, score_cutoff: int):
+    """Best choice index + score per query, scoring large batches in parallel."""
+    n_cpu = os.cpu_count() or 1
+    if len(queries) < PARALLEL_MIN_QUERIES or n_cpu == 1:
+        return _score_block(queries, choices, score_cutoff, workers=-1)
+
+    # cdist releases the GIL, so threads scale; reducing each block to its
+    # argmax also avoids holding the full N x M matrix at once
+    blocks = np.array_split(queries, n_cpu)
+    with ThreadPoolExecutor(max_workers=n_cpu) as ex:
+        parts = list(
+            ex.map(lambda q: _score_block(q, choices, score_cutoff, workers=1), blocks)
+        )
+    return (
+        np.concatenate([b for b, _ in parts]),
+        np.concatenate([sc for _, sc in parts]),
+    )
+
+
 def enrich_with_registry(
     df: pd.DataFrame, reg: pd.DataFrame, fuzzy: bool = True, score_cutoff: int = 92
 ) -> pd.DataFrame:
     if df.empty or reg.empty or "vendor_name" not in df.columns:
         return df
 
-    work = df.copy()
-    work["vendor_clean"] = work["vendor_name"].map(_clean_name)
+    # shallow copy + new column: df's values are shared, not duplicated, on
+    # pandas 2.x too (assign() deep-copies there unless copy-on-write is on)
+    work = df.copy(deep=False)
+    work["vendor_clean"] = _clean_name_series(df["vendor_name"])
 
     key_cols = [
         "facility_id",
@@ -232,30 +437,23 @@ def enrich_with_registry(
 
     unresolved = exact["facility_id"].isna()
     if unresolved.any():
-        choices = reg["facility_name_clean"].tolist()
-        reg_take = reg.set_index("facility_name_clean")[key_cols].to_dict("index")
-
-        def best_match(q: str):
-            if not q:
-                return (None, 0)
-            m = process.extractOne(
-                q, choices, scorer=fuzz.token_sort_ratio, score_cutoff=score_cutoff
-            )
-            if not m:
-                return (None, 0)
-            return (m[0], m[1])
-
-        matches = exact.loc[unresolved, "vendor_clean"].map(best_match)
-        exact.loc[unresolved, "match_key"] = matches.map(
-            lambda x: x[0] if isinstance(x, tuple) else None
-        )
-        exact.loc[unresolved, "match_score"] = matches.map(
-            lambda x: x[1] if isinstance(x, tuple) else 0
-        )
+        choices = np.asarray(reg["facility_name_clean"].tolist(), dtype=object)
+        reg_take = reg.drop_duplicates("facility_name_clean", keep="last").set_index(
+            "facility_name_clean"
+        )[key_cols]
+
+        queries = exact.loc[unresolved, "vendor_clean"].to_numpy(dtype=object)
+        best, best_score = _best_matches(queries, choices, score_cutoff)
+        hit = (best_score >= score_cutoff) & (best_score > 0) & (queries != "")
+
+        exact.loc[unresolved, "match_key"] = np.where(hit, choices[best], None)
+        exact.loc[unresolved, "match_score"] = np.where(hit, best_score, 0)
 
         mask = exact["match_key"].notna()
         if mask.any():
-            exact.loc[mask, key_cols] = exact.loc[mask, "match_key"].map(reg_take)
+            matched = reg_take.loc[exact.loc[mask, "match_key"]]
+            for col in key_cols:
+                exact.loc[mask, col] = matched[col].to_numpy()
 
     return exact.drop(
         columns=["vendor_clean", "facility_name_clean", "match_key"], errors="ignore"
@@ -263,19 +461,23 @@ def enrich_with_registry(
 
 
 # ---------- Filters + aggregates ----------
+def _distinct(col: pd.Series):
+    """Distinct non-null values; categoricals read their (used) categories."""
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        return col.cat.remove_unused_categories().cat.categories
+    return col.dropna().unique()
+
+
 def available_filters(df: pd.DataFrame) -> Dict[str, List]:
     vendors = (
-        sorted(df["vendor_name"].dropna().unique().tolist())
-        if "vendor_name" in df.columns
-        else []
+        sorted(_distinct(df["vendor_name"])) if "vendor_name" in df.columns else []
     )
-    months = [
-        m
-        for m in MONTH_ORDER
-        if "report_month" in df.columns and (df["report_month"] == m).any()
-    ]
+    present = (
+        set(_distinct(df["report_month"])) if "report_month" in df.columns else set()
+    )
+    months = [m for m in MONTH_ORDER if m in present]
     years = (
-        sorted(df["report_year"].dropna().unique().astype(int).tolist())
+        np.sort(df["report_year"].dropna().unique().astype("int64")).tolist()
         if "report_year" in df.columns
         else []
     )
@@ -288,13 +490,13 @@ def filter_data(
     months: Optional[List[str]] = None,
     years: Optional[List[int]] = None,
 ) -> pd.DataFrame:
+    # Dropdown values come straight from available_filters, so they already
+    # match the stored vendor names / Title-case months exactly.
     out = df
     if vendors and "vendor_name" in out.columns:
-        vset = {v.lower().strip() for v in vendors}
-        out = out[out["vendor_name"].str.lower().isin(vset)]
+        out = out[out["vendor_name"].isin(vendors)]
     if months and "report_month" in out.columns:
-        mset = {m.title() for m in months}
-        out = out[out["report_month"].isin(mset)]
+        out = out[out["report_month"].isin(months)]
     if years and "report_year" in out.columns:
         out = out[out["report_year"].isin(years)]
     return out.reset_index(drop=True)
@@ -319,6 +521,89 @@ def totals(df: pd.DataFrame) -> Dict[str, float | int]:
 def top_vendors(df: pd.DataFrame, k: int = 20) -> pd.DataFrame:
     if df.empty or "vendor_name" not in df.columns or "amount" not in df.columns:
         return pd.DataFrame(columns=["vendor_name", "amount"])
-    grp = df.groupby("vendor_name", as_index=False, dropna=False)["amount"].sum()
-    grp = grp.sort_values("amount", ascending=False).head(k)
-    return grp.reset_index(drop=True)
+    # nlargest is a partial (heap) sort: O(N log k) instead of sorting every vendor
+    grp = df.groupby("vendor_name", observed=True, sort=False, dropna=False)[
+        "amount"
+    ].sum()
+    return grp.nlargest(k).reset_index()
+
+
+# ---------- Precomputed aggregates ----------
+CELL_KEYS = [
+    "vendor_name",
+    "report_year",
+    "report_month",
+    "ym",
+    "county",
+    "sub_county",
+]
+
+
+def _rollup(cells: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    if cells.empty or not set(keys).issubset(cells.columns):
+        return pd.DataFrame(columns=keys + ["amount"])
+    # observed=True: no Cartesian product of categorical keys; callers sort if needed
+    return cells.groupby(keys, as_index=False, observed=True, sort=False)[
+        "amount"
+    ].sum()
+
+
+def _aggregate_cells(cells: pd.DataFrame) -> Dict[str, pd.DataFrame | pd.Series]:
+    if cells.empty:
+        by_vendor = pd.Series(dtype="float64", name="amount")
+    else:
+        by_vendor = cells.groupby(
+            "vendor_name", dropna=False, observed=True, sort=False
+        )["amount"].sum()
+    return {
+        "cells": cells,
+        "by_vendor": by_vendor,
+        "by_ym": _rollup(cells, ["report_year", "report_month", "ym"]),
+        "by_county_sub": _rollup(cells, ["county", "sub_county"]),
+    }
+
+
+def build_aggregates(df: pd.DataFrame) -> Dict[str, pd.DataFrame | pd.Series]:
+    """
+    Roll the frame up once so callbacks only touch group-level tables.
+    - 'cells': amount + row count per (vendor, year, month[, county, sub_county])
+    - 'by_vendor': amount per vendor (unsorted; take `.nlargest(k)`)
+    - 'by_ym': amount per (report_year, report_month), with its 'ym' key
+    - 'by_county_sub': amount per (county, sub_county)
+    """
+    keys = [c for c in CELL_KEYS if c in df.columns]
+    if df.empty or "vendor_name" not in keys or "amount" not in df.columns:
+        return _aggregate_cells(pd.DataFrame(columns=keys + ["amount", "rows"]))
+    cells = df.groupby(keys, as_index=False, dropna=False, observed=True, sort=False)[
+        "amount"
+    ].agg(amount="sum", rows="size")
+    return _aggregate_cells(cells)
+
+
+def slice_aggregates(
+    aggs: Dict[str, pd.DataFrame | pd.Series],
+    vendors: Optional[List[str]] = None,
+    months: Optional[List[str]] = None,
+    years: Optional[List[int]] = None,
+) -> Dict[str, pd.DataFrame | pd.Series]:
+    """Aggregates for a filter selection; unfiltered requests reuse `aggs` as-is."""
+    if not (vendors or months or years):
+        return aggs
+    return _aggregate_cells(filter_data(aggs["cells"], vendors, months, years))
+
+
+def aggregate_totals(cells: pd.DataFrame) -> Dict[str, float | int]:
+    """Same shape as `totals`, computed from the 'cells' aggregate."""
+    if cells.empty:
+        return {
+            "total_amount": 0.0,
+            "total_facilities": 0,
+            "total_claims": 0,
+            "rows": 0,
+        }
+    return {
+        "total_amount": float(cells["amount"].sum(skipna=True)),
+        "total_facilities": int(cells["vendor_name"].nunique()),
+        "total_claims": 0,
+        "rows": int(cells["rows"].sum()),
+    }
@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
+import hashlib
+import os
 import re
+import shutil
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from itertools import chain
 from pathlib import Path
+from typing import Iterable, Iterator
 
 import pandas as pd
 
@@ -13,12 +20,71 @@ try:
 except Exception:
     HAVE_CAMELOT = False
 
+# Optional: PyMuPDF for fast text extraction; pdfplumber is the fallback.
+try:
+    import pymupdf
+
+    HAVE_PYMUPDF = True
+except Exception:
+    HAVE_PYMUPDF = False
+
+# Optional: pyarrow for Parquet output; CSV is written without it.
+try:
+    import pyarrow as pa
+
+    HAVE_PYARROW = True
+except Exception:
+    HAVE_PYARROW = False
+
 import pdfplumber
 
 # --------- Config ---------
 IN_DIR = Path("sha_disbursements_pdfs")
 OUT_DIR = Path("extracted_data")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
+# Max pages per pdfplumber handle; it caches parsed pages per open document,
+# so windows keep memory flat on long PDFs
+BATCH = 50
+# Skip image-only pages instead of running text extraction on them
+SKIP_SCANS = True
+# Reuse an existing output when its PDF is byte-identical to the last parse
+# and was parsed by this same code with the same extractors (hash kept in a
+# "<output>.sha" sidecar)
+REUSE_UNCHANGED = True
+# Mixed into that hash: outputs from other parser code, or from another text
+# extractor (PyMuPDF and pdfplumber rows differ), are reparsed, not reused
+PARSER_VERSION = hashlib.blake2b(Path(__file__).read_bytes(), digest_size=8).hexdigest()
+EXTRACTOR = ("pymupdf" if HAVE_PYMUPDF else "pdfplumber") + (
+    "+camelot" if HAVE_CAMELOT else ""
+)
+# Output columns; per-PDF Parquet files all share this schema
+COLUMNS = [
+    "vendor_name",
+    "claims",
+    "amount",
+    "report_month",
+    "report_year",
+    "schedule",
+    "source_pdf",
+]
+if HAVE_PYARROW:
+    SCHEMA = pa.schema(
+        [
+            ("vendor_name", pa.string()),
+            ("claims", pa.string()),
+            ("amount", pa.float64()),
+            ("report_month", pa.string()),
+            ("report_year", pa.int64()),
+            ("schedule", pa.int64()),
+            ("source_pdf", pa.string()),
+        ]
+    )
+# Text columns live in Arrow-backed strings (C string kernels) when available
+STR_DTYPE = "string[pyarrow]" if HAVE_PYARROW else "string"
+if HAVE_PYMUPDF:
+    WORD_FLAGS = pymupdf.TEXTFLAGS_WORDS & ~pymupdf.TEXT_MEDIABOX_CLIP
+# Words whose baselines are this close (pt) share a text line (as pdfplumber)
+LINE_TOL = 3.0
 
 MONTHS = {
     "JANUARY": 1,
@@ -35,24 +101,34 @@ MONTHS = {
     "DECEMBER": 12,
 }
 
-AMOUNT_RE = re.compile(r"(?P<amount>(?:\d{1,3}(?:,\d{3})*|\d+)(?:\.\d{2})?)\s*$")
 HEADER_HINT = re.compile(r"vendor\s*name|claim/?s|amount", re.I)
+YEAR_RE = re.compile(r"\d{4}")
+# whole digit runs in a filename ("JUNE2025-2" -> 2025, 2)
+DIGIT_RUN_RE = re.compile(r"\d+")
+DIGITS = frozenset("0123456789")
+AMOUNT_CHARS = DIGITS | {",", "."}
+NON_NUM_RE = re.compile(r"[^\d.,-]")
+WS_RE = re.compile(r"\s+")
+# camelot header substrings -> output column, checked in this order
+COLUMN_KEYS = (
+    ("vendor_name", ("vendor", "facility", "provider")),
+    ("claims", ("claim",)),
+    ("amount", ("amount", "kes", "ksh")),
+)
 
 
 # --------- Filename metadata ---------
 def parse_filename_meta(path: Path):
     s = path.stem.upper()
-    m_month = re.search(
-        r"(JANUARY|FEBRUARY|MARCH|APRIL|MAY|JUNE|JULY|AUGUST|SEPTEMBER|OCTOBER|NOVEMBER|DECEMBER)",
-        s,
-    )
-    month_name = m_month.group(1).title() if m_month else None
+    # month = leftmost month name anywhere in the stem (also glued: "PAIDJUNE")
+    hits = [(i, m) for m in MONTHS if (i := s.find(m)) >= 0]
+    month_name = min(hits)[1].title() if hits else None
 
-    m_year = re.search(r"(\d{4})", s)
-    year = int(m_year.group(1)) if m_year else None
+    m_year = YEAR_RE.search(s)
+    year = int(m_year.group()) if m_year else None
 
     # schedule = trailing/nearby small int not equal to year or year%100
-    nums = [int(x) for x in re.findall(r"(?<!\d)(\d{1,2})(?!\d)", s)]
+    nums = [int(t) for t in DIGIT_RUN_RE.findall(s) if len(t) <= 2]
     schedule = 1
     if nums:
         if year:
@@ -63,15 +139,33 @@ def parse_filename_meta(path: Path):
 
 
 # --------- Normalization ---------
-def normalize_amount(x):
-    if x is None:
-        return pd.NA
-    x = re.sub(r"[^\d.,-]", "", str(x))
-    x = x.replace(",", "")
-    try:
-        return float(x)
-    except Exception:
-        return pd.NA
+def normalize_amount(s: pd.Series) -> pd.Series:
+    """Amount text -> float64 for a whole column (NaN when unparseable)."""
+    s = (
+        s.astype(STR_DTYPE)
+        .str.replace(NON_NUM_RE, "", regex=True)
+        .str.replace(",", "", regex=False)
+    )
+    return pd.to_numeric(s, errors="coerce").astype("float64")
+
+
+def tail_amount(line: str):
+    """
+    (start, amount_str) for the number ending `line`, else None.
+    A reverse scan over trailing digits/commas/dots: linear, no regex
+    backtracking, and lines without a trailing digit exit immediately.
+    """
+    end = len(line)
+    while end and line[end - 1].isspace():
+        end -= 1
+    if not end or line[end - 1] not in DIGITS:
+        return None
+    i = end
+    while i and line[i - 1] in AMOUNT_CHARS:
+        i -= 1
+    while line[i] not in DIGITS:  # no leading separators
+        i += 1
+    return i, line[i:end]
 
 
 # --------- Extractors ---------
@@ -83,6 +177,7 @@ def try_camelot(pdf_path: str) -> pd.DataFrame:
         strip_text="\n\r\t",
         edge_tol=500,
         row_tol=10,
+        suppress_stdout=True,
     )
     frames = []
     for t in tables:
@@ -95,42 +190,33 @@ def try_camelot(pdf_path: str) -> pd.DataFrame:
             df = df.iloc[1:].reset_index(drop=True)
 
         # heuristic rename/position
-        cols = [str(c).strip() for c in df.columns]
         mapping = {}
-        for i, c in enumerate(cols):
-            lc = c.lower()
-            if "vendor" in lc or "facility" in lc or "provider" in lc:
-                mapping[df.columns[i]] = "vendor_name"
-            elif "claim" in lc:
-                mapping[df.columns[i]] = "claims"
-            elif "amount" in lc or "kes" in lc or "ksh" in lc:
-                mapping[df.columns[i]] = "amount"
-        if mapping:
-            df = df.rename(columns=mapping)
-        else:
-            take = list(df.columns)[:3]
-            pos_map = {}
-            if len(take) > 0:
-                pos_map[take[0]] = "vendor_name"
-            if len(take) > 1:
-                pos_map[take[1]] = "claims"
-            if len(take) > 2:
-                pos_map[take[2]] = "amount"
-            df = df.rename(columns=pos_map)
-
-        # clean
         for c in df.columns:
-            df[c] = df[c].astype(str).str.replace(r"\s+", " ", regex=True).str.strip()
-        # drop header repeats
-        df = df[
-            ~df.apply(
-                lambda r: HEADER_HINT.search(" ".join(r.values.astype(str)) or ""),
-                axis=1,
+            lc = str(c).strip().lower()
+            target = next(
+                (name for name, keys in COLUMN_KEYS if any(k in lc for k in keys)),
+                None,
             )
-        ]
+            if target:
+                mapping[c] = target
+        if not mapping:
+            mapping = dict(zip(list(df.columns)[:3], COLUMNS[:3]))
+        df = df.rename(columns=mapping)
+
+        # clean
+        df = (
+            df.astype(STR_DTYPE)
+            .replace(WS_RE, " ", regex=True)
+            .apply(lambda s: s.str.strip())
+        )
+        # drop header repeats: join each row's cells (vectorized) and test once
+        joined = df.iloc[:, 0].str.cat(
+            [df.iloc[:, i] for i in range(1, df.shape[1])], sep=" "
+        )
+        df = df[~joined.str.contains(HEADER_HINT, regex=True, na=False)]
         # amount numeric
         if "amount" in df.columns:
-            df["amount"] = df["amount"].map(normalize_amount)
+            df["amount"] = normalize_amount(df["amount"])
 
         frames.append(df[["vendor_name", "claims", "amount"]].copy())
 
@@ -138,109 +224,287 @@ def try_camelot(pdf_path: str) -> pd.DataFrame:
         return pd.DataFrame(columns=["vendor_name", "claims", "amount"])
     out = pd.concat(frames, ignore_index=True).dropna(how="all")
     out = out[
-        (out["vendor_name"].notna() & (out["vendor_name"].astype(str).str.len() > 0))
+        (out["vendor_name"].notna() & (out["vendor_name"].str.len() > 0))
         | out["amount"].notna()
     ]
     return out
 
 
-def parse_by_regex(pdf_path: str) -> pd.DataFrame:
-    rows = []
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text() or ""
-            for raw_line in text.splitlines():
-                line = raw_line.strip()
-                if not line or HEADER_HINT.search(line):
-                    continue
-                m = AMOUNT_RE.search(line)
-                if not m:
-                    continue
-                amt = m.group("amount")
-                vendor = line[: m.start()].rstrip(" \t:·|").strip()
-                if not vendor or len(vendor) < 2:
-                    continue
-                rows.append(
-                    {
-                        "vendor_name": vendor,
-                        "claims": pd.NA,
-                        "amount": normalize_amount(amt),
-                    }
-                )
-    df = pd.DataFrame(rows)
-    if not df.empty:
-        df = df.drop_duplicates().reset_index(drop=True)
-    return df
+def _page_text(page, pdf_name: str) -> str:
+    # image-only (scanned) page: no text operators, so skip the text decode
+    if SKIP_SCANS and not page.chars and page.images:
+        print(
+            f"Warning: page {page.page_number} of {pdf_name} is an "
+            "image with no text; skipped (OCR it to include)."
+        )
+        return ""
+    return page.extract_text() or ""
+
+
+def pdfplumber_texts(pdf_path: Path) -> Iterator[str]:
+    """
+    Text of every page via pdfplumber, in order, read serially in windows of
+    at most BATCH pages (one short-lived handle each). A window shorter than
+    BATCH is the last, so the page count is never probed separately.
+    """
+    start = 0
+    while True:
+        window = range(start + 1, start + BATCH + 1)
+        with pdfplumber.open(pdf_path, pages=window) as pdf:
+            for page in pdf.pages:
+                yield _page_text(page, Path(pdf_path).name)
+            if len(pdf.pages) < BATCH:
+                return
+        start += BATCH
+
+
+def _pymupdf_page_text(page, pdf_name: str) -> str:
+    # PyMuPDF emits each table cell as its own line; rebuild the visual rows
+    # from word boxes (x0, y0, x1, y1, word, ...) so parse_line sees
+    # "vendor ... amount" exactly as with pdfplumber. The default word flags
+    # clip glyphs to their cell box, truncating long names; keep them whole.
+    words = page.get_text("words", flags=WORD_FLAGS)
+    words.sort(key=lambda w: (w[3], w[0]))
+    if not words:
+        if page.get_images():
+            print(
+                f"Warning: page {page.number + 1} of {pdf_name} is an "
+                "image with no text; skipped (OCR it to include)."
+            )
+        return ""
+    rows, row, row_y = [], [], None
+    for w in words:
+        if row and w[3] - row_y > LINE_TOL:
+            rows.append(row)
+            row = []
+        if not row:
+            row_y = w[3]
+        row.append(w)
+    rows.append(row)
+    return "\n".join(
+        " ".join(w[4] for w in sorted(r, key=lambda w: w[0])) for r in rows
+    )
+
+
+def page_texts(pdf_path: Path) -> Iterator[str]:
+    """
+    Page texts in order, extracted lazily as they are consumed: PyMuPDF
+    (MuPDF's C parser; far faster) when installed and able to open the
+    file, else pdfplumber.
+    """
+    if HAVE_PYMUPDF:
+        try:
+            doc = pymupdf.open(pdf_path)
+        except Exception:
+            doc = None  # unreadable for MuPDF: let pdfplumber have a go
+        if doc is not None:
+            with doc:
+                for page in doc:
+                    yield _pymupdf_page_text(page, Path(pdf_path).name)
+            return
+    yield from pdfplumber_texts(pdf_path)
+
+
+def parse_line(line: str):
+    """(vendor, amount_str) for a 'vendor ... amount' text line, else None."""
+    # the scan rejects most lines (no trailing number) without touching the
+    # regex engine; only candidate rows pay for the header check
+    line = line.strip()
+    tail = tail_amount(line)
+    if not tail or HEADER_HINT.search(line):
+        return None
+    start, amt = tail
+    vendor = line[:start].rstrip(" \t:·|").strip()
+    if not vendor or len(vendor) < 2:
+        return None
+    return vendor, amt
+
+
+def has_amount_lines(text: str) -> bool:
+    """Cheap probe: does this page's text already contain vendor/amount rows?"""
+    return any(parse_line(line) for line in text.splitlines())
+
+
+def parse_by_regex(texts: Iterable[str]) -> pd.DataFrame:
+    # column lists (not per-row dicts); the frame is built once at the end
+    vendors, amounts = [], []
+    for text in texts:
+        for raw_line in text.splitlines():
+            parsed = parse_line(raw_line)
+            if parsed:
+                vendors.append(parsed[0])
+                amounts.append(parsed[1])
+    if not vendors:
+        return pd.DataFrame()
+    df = pd.DataFrame(
+        {
+            "vendor_name": pd.array(vendors, dtype=STR_DTYPE),
+            "claims": pd.array([pd.NA] * len(vendors), dtype=STR_DTYPE),
+            "amount": normalize_amount(pd.Series(amounts, dtype=STR_DTYPE)),
+        }
+    )
+    df.drop_duplicates(subset=["vendor_name", "amount"], inplace=True)
+    return df.reset_index(drop=True)
+
+
+# --------- Output ---------
+def out_path_for(pdf_path: Path, suffix: str) -> Path:
+    return OUT_DIR / (pdf_path.stem + suffix)
+
+
+def write_table(df: pd.DataFrame, path: Path) -> None:
+    """Parquet (typed, snappy-compressed) for .parquet paths, else CSV."""
+    if path.suffix == ".parquet":
+        df.to_parquet(
+            path, index=False, engine="pyarrow", compression="snappy", schema=SCHEMA
+        )
+    else:
+        df.to_csv(path, index=False)
+
+
+def read_table(path: Path) -> pd.DataFrame:
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path, engine="pyarrow")
+    return pd.read_csv(path)
+
+
+def file_hash(path: Path, salt: str = "") -> str:
+    """blake2b of the file's bytes (streamed, not read into memory) + `salt`."""
+    with open(path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):  # 3.11+: C-level read loop
+            h = hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16))
+        else:
+            h = hashlib.blake2b(digest_size=16)
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    h.update(salt.encode())
+    return h.hexdigest()
+
+
+def write_master(parts: list[Path], master_path: Path) -> None:
+    """
+    Concatenate per-PDF outputs into the master CSV (what the dashboard and
+    its deploy read), holding at most one per-PDF table in memory.
+    """
+    with open(master_path, "w", encoding="utf-8", newline="") as master:
+        for i, part in enumerate(parts):
+            if part.suffix == ".parquet":
+                read_table(part).to_csv(master, index=False, header=i == 0)
+                continue
+            # CSV parts: header once, then each file's body copied through
+            with open(part, encoding="utf-8", newline="") as f:
+                header = f.readline()
+                if i == 0:
+                    master.write(header)
+                shutil.copyfileobj(f, master)
 
 
 # --------- Core parse ---------
-def parse_one(pdf_path: Path, out_csv: Path | None = None) -> pd.DataFrame:
+def parse_one(pdf_path: Path, out_path: Path | None = None) -> pd.DataFrame:
     month_name, year, schedule = parse_filename_meta(pdf_path)
 
-    # 1) Camelot first
-    if HAVE_CAMELOT:
-        try:
-            df = try_camelot(str(pdf_path))
-        except Exception:
-            df = pd.DataFrame()
+    if out_path is None:
+        out_path = out_path_for(pdf_path, ".parquet" if HAVE_PYARROW else ".csv")
     else:
+        # ensure it’s under OUT_DIR even if caller passed just a filename
+        if out_path.parent == Path("."):
+            out_path = OUT_DIR / out_path
+
+    # 0) Unchanged since the last run: hashing is far cheaper than parsing
+    sidecar = out_path.with_name(out_path.name + ".sha")
+    digest = (
+        file_hash(pdf_path, f"{PARSER_VERSION}:{EXTRACTOR}")
+        if REUSE_UNCHANGED
+        else None
+    )
+    if (
+        digest
+        and out_path.exists()
+        and sidecar.exists()
+        and sidecar.read_text().strip() == digest
+    ):
+        df = read_table(out_path)
+        print(f"Unchanged: {out_path}  rows={len(df)}")
+        return df
+
+    # Page text is read lazily: page 1 alone is probed, and the regex path
+    # continues from the same reader, so no page is extracted twice (and
+    # none past page 1 when camelot succeeds)
+    with closing(page_texts(pdf_path)) as pages:
+        first = next(pages, "")
+
+        # 1) Camelot first, unless page 1 already yields amount rows or has
+        #    no text layer at all (a scan: stream tables need text too)
         df = pd.DataFrame()
+        if HAVE_CAMELOT and first.strip() and not has_amount_lines(first):
+            try:
+                df = try_camelot(str(pdf_path))
+            except Exception:
+                df = pd.DataFrame()
 
-    # 2) Fallback to regex
-    if df.empty or df["amount"].dropna().empty:
-        df = parse_by_regex(str(pdf_path))
+        # 2) Fallback to regex
+        if df.empty or df["amount"].dropna().empty:
+            df = parse_by_regex(chain([first], pages))
 
     # 3) Finalize
-    for c in ["vendor_name", "claims", "amount"]:
+    for c in COLUMNS[:3]:
         if c not in df.columns:
             df[c] = pd.NA
-    df = df[["vendor_name", "claims", "amount"]].copy()
-    df["report_month"] = month_name
+    df = df[COLUMNS[:3]].astype({"vendor_name": STR_DTYPE, "claims": STR_DTYPE})
+    # per-file constants: one category each instead of a string per row
+    df["report_month"] = pd.Categorical([month_name] * len(df))
     df["report_year"] = year
     df["schedule"] = schedule
-    df["source_pdf"] = pdf_path.name
+    df["source_pdf"] = pd.Categorical([pdf_path.name] * len(df))
 
     # sanity
-    df = df[df["vendor_name"].notna() & (df["vendor_name"].astype(str).str.len() > 0)]
+    df = df[df["vendor_name"].notna() & (df["vendor_name"].str.len() > 0)]
     if df["amount"].notna().sum() == 0:
         print(
             f"Warning: 0 numeric amounts for {pdf_path.name}. Consider OCR if this is a scan."
         )
 
-    # write
-    if out_csv is None:
-        out_csv = OUT_DIR / (pdf_path.stem + ".csv")
-    else:
-        # ensure it’s under OUT_DIR even if caller passed just a filename
-        if out_csv.parent == Path("."):
-            out_csv = OUT_DIR / out_csv
-    out_csv.parent.mkdir(parents=True, exist_ok=True)
-    df.to_csv(out_csv, index=False)
+    # write (sidecar last, so an interrupted write is never reused)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    write_table(df, out_path)
+    if digest:
+        sidecar.write_text(digest + "\n")
     print(
-        f"Wrote: {out_csv}  rows={len(df)}  month={month_name} year={year} schedule={schedule}"
+        f"Wrote: {out_path}  rows={len(df)}  month={month_name} year={year} schedule={schedule}"
     )
     return df
 
 
 # --------- CLI ---------
+def _parse_one_worker(pdf_path: Path, suffix: str) -> tuple[Path, int]:
+    # module-level so ProcessPoolExecutor can pickle it; returns the output
+    # path (not the frame) so nothing large crosses the process boundary
+    out_path = out_path_for(pdf_path, suffix)
+    return out_path, len(parse_one(pdf_path, out_path))
+
+
 def main():
     # Modes:
     #   python parser.py some.pdf
     #   python parser.py                 -> first PDF in IN_DIR
     #   python parser.py --all           -> batch over IN_DIR, write master CSV
+    #   add --csv for per-PDF CSVs instead of Parquet (always CSV without pyarrow)
     args = sys.argv[1:]
+    suffix = ".parquet" if HAVE_PYARROW and "--csv" not in args else ".csv"
+    args = [a for a in args if a != "--csv"]
 
     if args and args[0] == "--all":
         pdfs = sorted(IN_DIR.glob("*.pdf"))
         if not pdfs:
             raise SystemExit(f"No PDFs found in {IN_DIR.resolve()}")
-        frames = []
-        for p in pdfs:
-            frames.append(parse_one(p, OUT_DIR / (p.stem + ".csv")))
-        master = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        # PDFs are independent and parsing is CPU-bound: one process per core
         master_path = OUT_DIR / "sha_disbursements_master.csv"
-        master.to_csv(master_path, index=False)
-        print(f"Master CSV: {master_path}  rows={len(master)}")
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+            results = list(
+                ex.map(_parse_one_worker, pdfs, [suffix] * len(pdfs), chunksize=1)
+            )
+        write_master([path for path, _ in results], master_path)
+        print(f"Master CSV: {master_path}  rows={sum(n for _, n in results)}")
         return
 
     if args:
@@ -256,7 +520,7 @@ def main():
     if not pdf_path.exists():
         raise SystemExit(f"Not found: {pdf_path}")
 
-    parse_one(pdf_path, OUT_DIR / (pdf_path.stem + ".csv"))
+    parse_one(pdf_path, out_path_for(pdf_path, suffix))
 
 
 if __name__ == "__main__":